@@ -3,43 +3,69 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options as ChromeOptions
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+from selenium.common.exceptions import WebDriverException
+import httpx
+from lxml import etree, html as lxml_html
 import pandas as pd
+import asyncio
+import atexit
+import cachetools
+import os
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, List
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import ORJSONResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, field_validator
 import tempfile
 import traceback
 import logging
 
 # Configurar logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="API de Consulta RUC SUNAT",
     description="API para consultar información de RUCs en SUNAT usando web scraping",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse  # Serialización JSON con orjson
 )
 
-# Configurar CORS para permitir peticiones desde cualquier origen
+# Configurar CORS: orígenes desde CORS_ORIGINS (separados por comas), por defecto cualquiera
+CORS_ORIGINS = [origen.strip() for origen in os.environ.get("CORS_ORIGINS", "*").split(",") if origen.strip()]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # En producción, especifica los orígenes permitidos
+    allow_origins=CORS_ORIGINS,  # En producción, especifica los orígenes permitidos
     allow_credentials=True,
-    allow_methods=["*"],  # Permite todos los métodos (GET, POST, etc.)
-    allow_headers=["*"],  # Permite todos los headers
+    allow_methods=["GET", "POST"],  # Los únicos métodos que expone la API
+    allow_headers=["content-type", "authorization"],
+    max_age=86400,  # Permite al navegador cachear el preflight un día
 )
 
+# Subrecursos que Chrome no necesita descargar para leer la página de SUNAT
+SUNAT_URLS_BLOQUEADAS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.woff", "*.woff2", "*.ttf", "*.css"]
+
+def _cerrar_si_existe(driver) -> None:
+    """Cierra un driver sin propagar errores (p. ej. uno a medio configurar)."""
+    if driver is None:
+        return
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.warning("Error al cerrar driver: %s", e)
+
 def config_driver():
     """Configura el WebDriver de Chrome para Cloud Run (modo headless).
     
     Optimizado para ejecutarse en contenedores sin interfaz gráfica.
     """
     chrome_options = ChromeOptions()
+    # driver.get vuelve en DOMContentLoaded; la espera real la hacen los WebDriverWait
+    chrome_options.page_load_strategy = 'eager'
     
     # Opciones esenciales para Cloud Run
     chrome_options.add_argument('--headless=new')  # Usar nuevo modo headless
@@ -52,8 +78,9 @@ def config_driver():
     chrome_options.add_argument('--disable-blink-features=AutomationControlled')
     chrome_options.add_argument('--disable-infobars')
     chrome_options.add_argument('--disable-setuid-sandbox')
-    chrome_options.add_argument('--single-process')  # Importante para Cloud Run
-    chrome_options.add_argument('--remote-debugging-port=9222')
+    chrome_options.add_argument('--no-zygote')  # Junto a --disable-dev-shm-usage basta para Cloud Run
+    chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+    chrome_options.add_argument('--disable-features=Translate,MediaRouter,OptimizationHints')
     
     # User-Agent realista para evitar bloqueos
     user_agent = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
@@ -67,7 +94,6 @@ def config_driver():
     # Configuraciones experimentales
     chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
     chrome_options.add_experimental_option('useAutomationExtension', False)
-    chrome_options.add_experimental_option("detach", True)
     
     # Preferencias para mejorar compatibilidad y seguridad
     prefs = {
@@ -75,10 +101,14 @@ def config_driver():
             "notifications": 2
         },
         "credentials_enable_service": False,
-        "profile.password_manager_enabled": False
+        "profile.password_manager_enabled": False,
+        # No descargar imágenes ni plugins: no se usan para el scraping
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.plugins": 2
     }
     chrome_options.add_experimental_option("prefs", prefs)
     
+    driver = None
     try:
         # Intentar usar Chrome desde la ubicación estándar
         driver = webdriver.Chrome(options=chrome_options)
@@ -91,8 +121,10 @@ def config_driver():
         driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
         
     except WebDriverException as e:
-        logger.error(f"Error al iniciar Chrome WebDriver: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error al iniciar Chrome WebDriver: %s", e)
+        # No dejar huérfano un Chrome que arrancó pero falló al configurarse
+        _cerrar_si_existe(driver)
+        driver = None
         # Intentar con ruta explícita de Chrome
         try:
             chrome_options.binary_location = "/usr/bin/google-chrome"
@@ -106,16 +138,360 @@ def config_driver():
             driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
             
         except Exception as e2:
-            logger.error(f"Error al iniciar Chrome con ruta explícita: {e2}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error al iniciar Chrome con ruta explícita: %s", e2)
+            _cerrar_si_existe(driver)
             raise
     
-    wait = WebDriverWait(driver, 20)  # Aumentar timeout a 20 segundos
+    # Bloquear recursos que no afectan a los datos (imágenes, CSS y fuentes)
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {"urls": SUNAT_URLS_BLOQUEADAS})
+    except Exception:
+        _cerrar_si_existe(driver)
+        raise
+    
+    wait = WebDriverWait(driver, 20, poll_frequency=0.1)  # Timeout de 20 s, sondeo cada 100 ms
     return driver, wait
 
-def consultar_ruc_sunat(ruc: str) -> Optional[Dict]:
+
+# Tamaño del pool de Chrome y número de consultas antes de reciclar cada driver
+POOL_SIZE = int(os.environ.get("DRIVER_POOL_SIZE", "2"))
+DRIVER_MAX_USOS = int(os.environ.get("DRIVER_MAX_USES", "50"))
+
+
+# Marca en la cola de un lugar del pool cuyo driver hay que volver a crear
+_LUGAR_VACIO = object()
+# Marca en la cola que despierta a quien espera en acquire() cuando el pool se cierra
+_POOL_CERRADO = object()
+
+
+class DriverPool:
+    """Pool acotado de WebDrivers de Chrome que se reutilizan entre consultas.
+
+    Mantiene `size` drivers calientes en una asyncio.Queue para no pagar el
+    arranque de Chrome en cada request. Cada driver se recicla tras
+    `max_usos` consultas (o si deja de responder) para contener fugas de memoria.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, max_usos: int = DRIVER_MAX_USOS):
+        self.size = size
+        self.max_usos = max_usos
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self._usos: Dict[webdriver.Chrome, int] = {}
+        self._cerrando = False
+
+    def _nuevo_driver(self):
+        driver, wait = config_driver()
+        self._usos[driver] = 0
+        return driver, wait
+
+    def _cerrar_driver(self, driver) -> None:
+        self._usos.pop(driver, None)
+        _cerrar_si_existe(driver)
+
+    async def start(self) -> None:
+        """Crea los drivers iniciales del pool en paralelo, fuera del event loop."""
+        drivers = await asyncio.gather(*[_en_executor(self._nuevo_driver) for _ in range(self.size)])
+        for driver, wait in drivers:
+            self._queue.put_nowait((driver, wait))
+        logger.info("Pool de Chrome iniciado con %d drivers", self.size)
+
+    async def acquire(self):
+        """Espera un driver libre y devuelve la tupla (driver, wait).
+
+        Si lo que sale de la cola es un lugar vacío (un driver que no se pudo
+        recrear), intenta crear uno nuevo; si falla, devuelve el lugar vacío a
+        la cola para que otro lo reintente.
+        """
+        if self._cerrando:
+            raise RuntimeError("El pool de Chrome se está cerrando")
+        entrada = await self._queue.get()
+        if self._cerrando:
+            # Devolver la entrada para que el siguiente en espera también despierte
+            self._queue.put_nowait(entrada)
+            raise RuntimeError("El pool de Chrome se está cerrando")
+        if entrada is _LUGAR_VACIO:
+            try:
+                return await _en_executor(self._nuevo_driver)
+            except Exception:
+                self._queue.put_nowait(_LUGAR_VACIO)
+                raise
+        return entrada
+
+    def _preparar_reuso(self, driver, wait):
+        """Limpia la sesión del driver o lo recicla; devuelve (driver, wait) o None."""
+        self._usos[driver] = self._usos.get(driver, 0) + 1
+        reciclar = self._usos[driver] >= self.max_usos
+        if reciclar:
+            logger.info("Reciclando driver tras %d consultas", self._usos[driver])
+        else:
+            try:
+                driver.delete_all_cookies()
+            except WebDriverException as e:
+                logger.warning("Driver sin respuesta, reciclando: %s", e)
+                reciclar = True
+
+        if reciclar:
+            self._cerrar_driver(driver)
+            try:
+                return self._nuevo_driver()
+            except Exception as e:
+                logger.error("No se pudo reponer el driver del pool: %s", e)
+                return None
+        return driver, wait
+
+    async def release(self, driver, wait) -> None:
+        """Devuelve un driver al pool; la limpieza o el reciclaje corre en el executor."""
+        if self._cerrando:
+            # El executor de Chrome puede estar apagándose: cerrar el driver sin
+            # reciclarlo (si close() no lo cerró ya)
+            if self._usos.pop(driver, None) is not None:
+                await asyncio.to_thread(_cerrar_si_existe, driver)
+            return
+        entrada = await _en_executor(self._preparar_reuso, driver, wait)
+        # Si no se pudo reponer el driver se encola un lugar vacío, así quien
+        # espera en acquire() despierta e intenta crearlo
+        self._queue.put_nowait(_LUGAR_VACIO if entrada is None else entrada)
+
+    def iniciar_cierre(self) -> None:
+        """Deja de entregar y reciclar drivers: los que se devuelvan se cierran.
+
+        Si hay corrutinas esperando en acquire() (cola vacía), se les encola
+        _POOL_CERRADO para que despierten y fallen en lugar de colgarse.
+        """
+        self._cerrando = True
+        if self._queue.empty():
+            self._queue.put_nowait(_POOL_CERRADO)
+
+    def close(self) -> None:
+        """Cierra todos los drivers del pool."""
+        if not self._cerrando:
+            self.iniciar_cierre()
+        for driver in list(self._usos):
+            self._cerrar_driver(driver)
+
+
+# Caché en memoria de resultados por RUC (los datos del padrón cambian poco)
+RUC_CACHE_TTL = int(os.environ.get("RUC_CACHE_TTL", "86400"))
+ruc_cache: cachetools.TTLCache = cachetools.TTLCache(
+    maxsize=int(os.environ.get("RUC_CACHE_SIZE", "10000")),
+    ttl=RUC_CACHE_TTL
+)
+CACHE_HEADERS = {"Cache-Control": f"public, max-age={RUC_CACHE_TTL}"}
+# Consultas a SUNAT en curso por RUC, para no repetir la misma consulta en paralelo
+consultas_en_curso: Dict[str, asyncio.Task] = {}
+
+
+# Hilos para la consulta HTTP directa: no usa Chrome, así que no se limita al tamaño del pool
+HTTP_WORKERS = int(os.environ.get("HTTP_WORKERS", "16"))
+
+
+async def _en_executor(func, *args):
+    """Ejecuta trabajo bloqueante de Chrome en su executor sin bloquear el event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(getattr(app.state, "executor", None), func, *args)
+
+
+async def _en_executor_http(func, *args):
+    """Ejecuta la consulta HTTP bloqueante en su propio executor, aparte de Chrome."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(getattr(app.state, "http_executor", None), func, *args)
+
+# Endpoints de SUNAT (los mismos que usa el navegador)
+SUNAT_URL_CRITERIO = 'https://e-consultaruc.sunat.gob.pe/cl-ti-itmrconsruc/FrameCriterioBusquedaWeb.jsp'
+SUNAT_URL_CONSULTA = 'https://e-consultaruc.sunat.gob.pe/cl-ti-itmrconsruc/jcrS00Alias'
+
+# Si la consulta HTTP directa falla, reintentar con Selenium (SUNAT_SELENIUM_FALLBACK=0 lo desactiva)
+USAR_SELENIUM_RESPALDO = os.environ.get("SUNAT_SELENIUM_FALLBACK", "1").lower() in ("1", "true", "yes")
+
+HTTP_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'es-PE,es;q=0.9,en;q=0.8',
+    'Referer': SUNAT_URL_CRITERIO,
+}
+
+# XPaths de la página de SUNAT, compartidos por la consulta HTTP y Selenium
+XPATH_INPUT_RUC = "//input[@placeholder='Ingrese RUC']"
+XPATH_TITULO_RUC = "//h4[contains(text(), 'Número de RUC:')]"
+XPATH_RUC_NOMBRE = (
+    "//div[contains(@class, 'list-group-item')]/div/div[h4[contains(text(), 'Número de RUC:')]]/following-sibling::div/h4"
+)
+TITULO_ACTIVIDADES = "Actividad(es) Económica(s)"
+XPATH_TITULO_ACTIVIDADES = f"//h4[contains(text(), '{TITULO_ACTIVIDADES}')]"
+XPATH_ACTIVIDADES = XPATH_TITULO_ACTIVIDADES + "/../following-sibling::div//table//tr"
+MAPEO = {
+    "Nombre Comercial": "//h4[contains(text(), 'Nombre Comercial')]/../following-sibling::div/p",
+    "Tipo Contribuyente": "//h4[contains(text(), 'Tipo Contribuyente')]/../following-sibling::div/p",
+    "Estado del Contribuyente": "//h4[contains(text(), 'Estado del Contribuyente')]/../following-sibling::div/p",
+    "Condición del Contribuyente": "//h4[contains(text(), 'Condición del Contribuyente')]/../following-sibling::div/p",
+    "Domicilio Fiscal": "//h4[contains(text(), 'Domicilio Fiscal')]/../following-sibling::div/p",
+}
+
+# XPaths compilados una sola vez y reutilizados en cada consulta HTTP
+LXML_NUM_RND = etree.XPath("//input[@name='numRnd']/@value")
+LXML_RUC_NOMBRE = etree.XPath(XPATH_RUC_NOMBRE)
+LXML_CAMPOS = {campo: etree.XPath(xpath) for campo, xpath in MAPEO.items()}
+LXML_ACTIVIDADES = etree.XPath(XPATH_ACTIVIDADES)
+
+# Script que extrae en el navegador todos los campos del resultado en una sola llamada.
+# Recorre una vez los títulos con un selector CSS y ubica cada valor por posición
+# (columna siguiente al título); si SUNAT cambia la estructura, usa el XPath como respaldo.
+# Recibe {campo: xpath} en arguments[0], el XPath de las filas de actividades en
+# arguments[1] y el título de actividades en arguments[2]; devuelve las actividades
+# ya unidas por fila como list[str].
+SCRIPT_EXTRAER_DETALLE = """
+    const limpiar = (texto) => texto.replace(/\\s+/g, ' ').trim();
+    const buscar = (xp) => document.evaluate(
+        xp, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+    ).singleNodeValue;
+    const columnas = [];
+    for (const h4 of document.querySelectorAll('.list-group-item h4')) {
+        const columna = h4.parentElement.nextElementSibling;
+        if (columna) {
+            columnas.push([limpiar(h4.textContent), columna]);
+        }
+    }
+    const columnaDe = (titulo) => {
+        const par = columnas.find(([texto]) => texto.startsWith(titulo));
+        return par ? par[1] : null;
+    };
+    const out = {};
+    for (const [campo, xp] of Object.entries(arguments[0])) {
+        const columna = columnaDe(campo);
+        const nodo = (columna && columna.querySelector(':scope > p, :scope > h4')) || buscar(xp);
+        out[campo] = nodo ? limpiar(nodo.textContent) : null;
+    }
+    const columnaActividades = columnaDe(arguments[2]);
+    let filas = columnaActividades ? [...columnaActividades.querySelectorAll('table tr')] : [];
+    if (!filas.length) {
+        const snapshot = document.evaluate(
+            arguments[1], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null
+        );
+        for (let i = 0; i < snapshot.snapshotLength; i++) {
+            filas.push(snapshot.snapshotItem(i));
+        }
+    }
+    out.actividades = [];
+    for (const fila of filas) {
+        const celdas = [...fila.querySelectorAll('td')]
+            .map(td => limpiar(td.textContent))
+            .filter(Boolean);
+        if (celdas.length) {
+            out.actividades.push(celdas.join(' - '));
+        }
+    }
+    return out;
+"""
+# Campos que devuelve el script: nombre/RUC más los de MAPEO
+MAPEO_SELENIUM = {"Número de RUC": XPATH_RUC_NOMBRE, **MAPEO}
+
+
+def _texto(elemento) -> str:
+    """Devuelve el texto de un nodo lxml con los espacios normalizados."""
+    return " ".join(elemento.text_content().split())
+
+
+def _parsear_html(respuesta: httpx.Response):
+    """Parsea la respuesta con el charset del header Content-Type.
+
+    Si el header no trae charset se pasa None, para que lxml use el
+    <meta charset> de la página en lugar del utf-8 por defecto de httpx.
+    """
+    parser = lxml_html.HTMLParser(encoding=respuesta.charset_encoding)
+    return lxml_html.fromstring(respuesta.content, parser=parser)
+
+
+def _obtener_num_rnd(client: httpx.Client) -> Optional[str]:
+    """Obtiene el token numRnd que SUNAT exige en el formulario de consulta.
+
+    Primero lo busca en la página de criterios; si no aparece, hace una
+    búsqueda por razón social (como el navegador) para que SUNAT lo emita.
+    """
+    respuesta = client.get(SUNAT_URL_CRITERIO)
+    respuesta.raise_for_status()
+    valores = LXML_NUM_RND(_parsear_html(respuesta))
+    if valores:
+        return valores[0]
+
+    respuesta = client.post(SUNAT_URL_CONSULTA, data={
+        'accion': 'consPorRazonSoc',
+        'razSoc': 'SUNAT',
+    })
+    respuesta.raise_for_status()
+    valores = LXML_NUM_RND(_parsear_html(respuesta))
+    return valores[0] if valores else None
+
+
+def consultar_ruc_sunat_http(ruc: str) -> Optional[Dict]:
+    """Consulta un RUC haciendo el POST directo al endpoint de SUNAT.
+
+    Evita levantar Chrome: replica el formulario de búsqueda con httpx y
+    parsea la respuesta con lxml usando los mismos XPaths que Selenium.
+
+    Args:
+        ruc: Número de RUC a consultar (11 dígitos)
+
+    Returns:
+        Dict con los datos del RUC, o None si no se pudo obtener información.
+    """
+    try:
+        with httpx.Client(http2=True, headers=HTTP_HEADERS, timeout=20, follow_redirects=True) as client:
+            num_rnd = _obtener_num_rnd(client)
+            if num_rnd is None:
+                logger.warning("SUNAT no emitió numRnd para RUC %s", ruc)
+                return None
+            formulario = {
+                'accion': 'consPorRuc',
+                'actReturn': '1',
+                'modo': '1',
+                'nroRuc': ruc,
+                'numRnd': num_rnd,
+            }
+            respuesta = client.post(SUNAT_URL_CONSULTA, data=formulario)
+            respuesta.raise_for_status()
+
+        tree = _parsear_html(respuesta)
+
+        # Número de RUC y nombre
+        ruc_text_el = LXML_RUC_NOMBRE(tree)
+        if not ruc_text_el:
+            logger.warning("SUNAT no devolvió el bloque de resultado para RUC %s", ruc)
+            return None
+        numero_ruc, nombre = _texto(ruc_text_el[0]).split(' - ', 1)
+        detalle = {
+            'Número de RUC': numero_ruc.strip(),
+            'Nombre': nombre.strip()
+        }
+
+        # Otros campos
+        for campo, xpath in LXML_CAMPOS.items():
+            nodos = xpath(tree)
+            detalle[campo] = _texto(nodos[0]) if nodos else None
+
+        # Actividades económicas (todas las filas)
+        actividades_list = []
+        for row in LXML_ACTIVIDADES(tree):
+            actividad = " - ".join([_texto(celda) for celda in row.findall('td') if _texto(celda)])
+            if actividad:
+                actividades_list.append(actividad)
+        detalle["Actividades Economicas"] = "; ".join(actividades_list) if actividades_list else None
+
+        return detalle
+    except Exception:
+        logger.exception("Error en consulta HTTP del RUC %s", ruc)
+        return None
+
+
+async def consultar_ruc_sunat(ruc: str) -> Optional[Dict]:
     """Consulta un único RUC en SUNAT y devuelve un diccionario con los datos.
 
+    Los resultados se guardan en caché durante RUC_CACHE_TTL segundos, y las
+    consultas simultáneas del mismo RUC comparten una sola consulta a SUNAT.
+    Usa la consulta HTTP directa y, si falla y SUNAT_SELENIUM_FALLBACK está
+    activo, reintenta con Selenium.
+
     Args:
         ruc: Número de RUC a consultar (11 dígitos)
 
@@ -123,31 +499,80 @@ def consultar_ruc_sunat(ruc: str) -> Optional[Dict]:
         Dict con los datos del RUC, o None si no se pudo obtener información.
         
     Ejemplo:
-        datos = consultar_ruc_sunat("20606333227")
+        datos = await consultar_ruc_sunat("20606333227")
+    """
+    # Una sola lectura: un `in` seguido de `[]` puede vencer entre ambos
+    detalle = ruc_cache.get(ruc)
+    if detalle is not None:
+        logger.info("RUC %s obtenido desde caché", ruc)
+        return detalle
+
+    # La caché y las consultas en curso solo se tocan desde el event loop
+    tarea = consultas_en_curso.get(ruc)
+    if tarea is None:
+        tarea = asyncio.create_task(_consultar_ruc_sunat_sin_cache(ruc))
+        consultas_en_curso[ruc] = tarea
+        tarea.add_done_callback(lambda _: consultas_en_curso.pop(ruc, None))
+    else:
+        logger.info("RUC %s ya se está consultando, esperando ese resultado", ruc)
+    # shield: si se cancela un llamador, la consulta sigue para los demás
+    return await asyncio.shield(tarea)
+
+
+async def _consultar_ruc_sunat_sin_cache(ruc: str) -> Optional[Dict]:
+    """Consulta SUNAT (HTTP y, si hace falta, Selenium) y guarda el resultado en caché."""
+    detalle = await _en_executor_http(consultar_ruc_sunat_http, ruc)
+    if detalle is None and USAR_SELENIUM_RESPALDO:
+        driver_pool: Optional[DriverPool] = getattr(app.state, "pool", None)
+        if driver_pool is None:
+            logger.warning("Pool de Chrome no disponible, no se puede usar Selenium para RUC %s", ruc)
+            return None
+        logger.info("Consulta HTTP sin resultado para RUC %s, usando Selenium", ruc)
+        async with app.state.semaforo:
+            driver, wait = await driver_pool.acquire()
+            try:
+                detalle = await _en_executor(consultar_ruc_sunat_selenium, driver, wait, ruc)
+            finally:
+                await driver_pool.release(driver, wait)
+    if detalle is not None:
+        ruc_cache[ruc] = detalle
+    return detalle
+
+
+def consultar_ruc_sunat_selenium(driver, wait, ruc: str) -> Optional[Dict]:
+    """Consulta un RUC en SUNAT con Selenium (Chrome headless).
+
+    Args:
+        driver: WebDriver tomado del pool (no se cierra aquí)
+        wait: WebDriverWait asociado al driver
+        ruc: Número de RUC a consultar (11 dígitos)
+
+    Returns:
+        Dict con los datos del RUC, o None si no se pudo obtener información.
     """
-    driver, wait = config_driver()
     try:
-        logger.info(f"Intentando acceder a SUNAT para RUC: {ruc}")
+        logger.info("Intentando acceder a SUNAT para RUC: %s", ruc)
         
         # Intentar cargar la página con retry
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                driver.get('https://e-consultaruc.sunat.gob.pe/cl-ti-itmrconsruc/FrameCriterioBusquedaWeb.jsp')
-                logger.info(f"Página cargada exitosamente (intento {attempt + 1})")
+                driver.get(SUNAT_URL_CRITERIO)
+                logger.info("Página cargada exitosamente (intento %d)", attempt + 1)
                 break
             except WebDriverException as e:
                 if "ERR_CONNECTION_RESET" in str(e) or "ERR_CONNECTION_REFUSED" in str(e):
-                    logger.warning(f"Intento {attempt + 1}/{max_retries} falló: {e}")
+                    logger.warning("Intento %d/%d falló: %s", attempt + 1, max_retries, e)
                     if attempt < max_retries - 1:
                         time.sleep(2 ** attempt)  # Backoff exponencial: 1s, 2s, 4s
                         continue
                 raise
         
-        # Pequeña pausa para que la página cargue completamente
-        time.sleep(2)
-        input_ruc = driver.find_element(By.XPATH, "//input[@placeholder='Ingrese RUC']")
-        btn_buscar = driver.find_element(By.ID, 'btnAceptar')
+        # Esperar a que el formulario esté listo en lugar de una pausa fija
+        input_ruc = wait.until(EC.presence_of_element_located(
+            (By.XPATH, XPATH_INPUT_RUC)
+        ))
+        btn_buscar = wait.until(EC.element_to_be_clickable((By.ID, 'btnAceptar')))
 
         input_ruc.clear()
         input_ruc.send_keys(ruc)
@@ -155,76 +580,115 @@ def consultar_ruc_sunat(ruc: str) -> Optional[Dict]:
 
         # Esperar bloque de resultado
         wait.until(EC.visibility_of_element_located(
-            (By.XPATH, "//h4[contains(text(), 'Número de RUC:')]")
+            (By.XPATH, XPATH_TITULO_RUC)
         ))
 
-        # Número de RUC y nombre
-        ruc_text_el = driver.find_element(
-            By.XPATH,
-            "//div[contains(@class, 'list-group-item')]/div/div[h4[contains(text(), 'Número de RUC:')]]/following-sibling::div/h4"
+        # Extraer todos los campos en una sola llamada a execute_script
+        datos = driver.execute_script(
+            SCRIPT_EXTRAER_DETALLE, MAPEO_SELENIUM, XPATH_ACTIVIDADES, TITULO_ACTIVIDADES
         )
-        numero_ruc, nombre = ruc_text_el.text.split(' - ', 1)
+
+        # Número de RUC y nombre
+        numero_ruc, nombre = datos.pop("Número de RUC").split(' - ', 1)
+        actividades_list = datos.pop("actividades")
         detalle = {
             'Número de RUC': numero_ruc.strip(),
             'Nombre': nombre.strip()
         }
-
-        # Otros campos
-        mapeo = {
-            "Nombre Comercial": "//h4[contains(text(), 'Nombre Comercial')]/../following-sibling::div/p",
-            "Tipo Contribuyente": "//h4[contains(text(), 'Tipo Contribuyente')]/../following-sibling::div/p",
-            "Estado del Contribuyente": "//h4[contains(text(), 'Estado del Contribuyente')]/../following-sibling::div/p",
-            "Condición del Contribuyente": "//h4[contains(text(), 'Condición del Contribuyente')]/../following-sibling::div/p",
-            "Domicilio Fiscal": "//h4[contains(text(), 'Domicilio Fiscal')]/../following-sibling::div/p",
-        }
-        for campo, xpath in mapeo.items():
-            try:
-                detalle[campo] = wait.until(
-                    EC.visibility_of_element_located((By.XPATH, xpath))
-                ).text.strip()
-            except (TimeoutException, NoSuchElementException):
-                detalle[campo] = None
-
-        # Actividades económicas (todas las filas)
-        try:
-            actividades_rows = driver.find_elements(
-                By.XPATH,
-                "//h4[contains(text(), 'Actividad(es) Económica(s)')]/../following-sibling::div//table//tr"
-            )
-            actividades_list = []
-            for row in actividades_rows:
-                celdas = row.find_elements(By.TAG_NAME, "td")
-                if len(celdas) > 0:
-                    actividad = " - ".join([celda.text.strip() for celda in celdas if celda.text.strip()])
-                    if actividad:
-                        actividades_list.append(actividad)
-            detalle["Actividades Economicas"] = "; ".join(actividades_list) if actividades_list else None
-        except (TimeoutException, NoSuchElementException):
-            detalle["Actividades Economicas"] = None
+        detalle.update(datos)
+        detalle["Actividades Economicas"] = "; ".join(actividades_list) if actividades_list else None
 
         return detalle
-    except Exception as e:
-        error_msg = f"Error en consulta RUC {ruc}: {str(e)}"
-        error_trace = traceback.format_exc()
-        logger.error(error_msg)
-        logger.error(error_trace)
-        print(f"❌ {error_msg}")
-        print(f"Traceback: {error_trace}")
+    except Exception:
+        logger.exception("Error en consulta RUC %s", ruc)
         return None
-    finally:
-        try:
-            driver.quit()
-        except Exception as e:
-            logger.warning(f"Error al cerrar driver: {e}")
 
 # Modelos Pydantic para la API
+# Formato de RUC: prefijo de tipo de contribuyente + 9 dígitos, el último es el verificador
+RUC_RE = re.compile(r"^(10|15|16|17|20)[0-9]{9}$")
+RUC_FACTORES = (5, 4, 3, 2, 7, 6, 5, 4, 3, 2)
+
+def validar_ruc(ruc: str) -> str:
+    """Valida formato y dígito verificador (módulo 11) de un RUC.
+
+    Se ejecuta antes de consultar SUNAT para no gastar una consulta en un RUC inválido.
+
+    Raises:
+        ValueError: Si el RUC no tiene un formato válido o el dígito verificador no coincide.
+    """
+    ruc = ruc.strip()
+    if not RUC_RE.match(ruc):
+        raise ValueError(f"RUC {ruc} inválido: debe tener 11 dígitos y empezar con 10, 15, 16, 17 o 20")
+    suma = sum(int(digito) * factor for digito, factor in zip(ruc, RUC_FACTORES))
+    verificador = (11 - suma % 11) % 10
+    if verificador != int(ruc[-1]):
+        raise ValueError(f"RUC {ruc} inválido: el dígito verificador no coincide")
+    return ruc
+
 class ConsultaRUCRequest(BaseModel):
     ruc: str
 
+    @field_validator('ruc')
+    @classmethod
+    def _validar_ruc(cls, ruc: str) -> str:
+        return validar_ruc(ruc)
+
 class ConsultaMultipleRUCRequest(BaseModel):
     rucs: List[str]
     guardar_excel: bool = False
 
+    @field_validator('rucs')
+    @classmethod
+    def _validar_rucs(cls, rucs: List[str]) -> List[str]:
+        return [validar_ruc(ruc) for ruc in rucs]
+
+@app.on_event("startup")
+async def iniciar_recursos():
+    """Crea los recursos compartidos por todos los endpoints en app.state.
+
+    - executor: hilos para el trabajo bloqueante de Chrome (tamaño del pool)
+    - http_executor: hilos para la consulta HTTP directa (HTTP_WORKERS)
+    - semaforo: límite de consultas simultáneas con Selenium
+    - http_client: cliente HTTP para los diagnósticos de red
+    - pool: pool de Chrome usado como respaldo (None si está desactivado o no pudo iniciar)
+    """
+    app.state.executor = ThreadPoolExecutor(max_workers=POOL_SIZE)
+    app.state.http_executor = ThreadPoolExecutor(max_workers=HTTP_WORKERS)
+    app.state.semaforo = asyncio.Semaphore(POOL_SIZE)
+    app.state.http_client = httpx.AsyncClient(http2=True, headers=HTTP_HEADERS, timeout=2)
+    app.state.pool = None
+    if not USAR_SELENIUM_RESPALDO:
+        return
+    pool = DriverPool(size=POOL_SIZE)
+    atexit.register(pool.close)
+    try:
+        await pool.start()
+    except Exception as e:
+        logger.exception("No se pudo iniciar el pool de Chrome: %s", e)
+        pool.close()
+        return
+    app.state.pool = pool
+
+@app.on_event("shutdown")
+async def cerrar_recursos():
+    """Libera los recursos de app.state al apagar el servidor.
+
+    uvicorn convierte el SIGTERM de Cloud Run en este evento, así que aquí se
+    cierran los Chrome del pool; atexit cubre las salidas que no pasan por él.
+    """
+    pool: Optional[DriverPool] = app.state.pool
+    if pool is not None:
+        pool.iniciar_cierre()
+    # Cancelar lo pendiente y esperar (fuera del event loop) a que termine lo que
+    # está en curso, antes de cerrar los drivers que esos hilos aún usan
+    await asyncio.gather(
+        asyncio.to_thread(app.state.executor.shutdown, wait=True, cancel_futures=True),
+        asyncio.to_thread(app.state.http_executor.shutdown, wait=True, cancel_futures=True),
+    )
+    if pool is not None:
+        pool.close()
+    await app.state.http_client.aclose()
+
 # Endpoints de la API
 @app.get("/")
 async def root():
@@ -234,6 +698,8 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "/health": "Health check",
+            "/test-network": "Diagnóstico de conectividad con Google y SUNAT",
+            "/test-chrome": "Diagnóstico de Chrome contra SUNAT (?full=1)",
             "/consulta-ruc": "Consultar un RUC individual (POST)",
             "/consulta-multiple": "Consultar múltiples RUCs (POST)",
             "/docs": "Documentación interactiva (Swagger UI)"
@@ -245,46 +711,91 @@ async def health_check():
     """Health check endpoint para Cloud Run."""
     return {"status": "healthy", "service": "consulta-ruc-sunat"}
 
+# URLs que se comprueban en los diagnósticos de red
+URLS_PRUEBA_RED = {
+    "google": "https://www.google.com",
+    "sunat": SUNAT_URL_CRITERIO,
+}
+
+async def _probar_url(url: str) -> Dict:
+    """Hace un HEAD a la URL y devuelve el código de estado y la latencia."""
+    inicio = time.perf_counter()
+    try:
+        respuesta = await app.state.http_client.head(url)
+        return {
+            "reachable": True,
+            "status_code": respuesta.status_code,
+            "elapsed_ms": round((time.perf_counter() - inicio) * 1000, 1)
+        }
+    except httpx.HTTPError as e:
+        return {"reachable": False, "error": f"{type(e).__name__}: {str(e)}"}
+
+@app.get("/test-network")
+async def test_network():
+    """Endpoint de diagnóstico liviano: comprueba por HTTP que Google y SUNAT respondan."""
+    nombres = list(URLS_PRUEBA_RED)
+    resultados = await asyncio.gather(*[_probar_url(URLS_PRUEBA_RED[nombre]) for nombre in nombres])
+    detalle = dict(zip(nombres, resultados))
+    return {
+        "status": "success" if all(r["reachable"] for r in resultados) else "error",
+        **detalle
+    }
+
+def _probar_chrome_sunat(driver) -> Dict:
+    """Verifica con el driver dado que el formulario de SUNAT cargue (bloqueante)."""
+    # Intentar navegar a SUNAT
+    logger.info("Navegando a SUNAT...")
+    driver.get(SUNAT_URL_CRITERIO)
+    sunat_title = driver.title
+    logger.info("Título de SUNAT: %s", sunat_title)
+    
+    # Verificar que existan los elementos necesarios
+    input_ruc = driver.find_element(By.XPATH, XPATH_INPUT_RUC)
+    btn_buscar = driver.find_element(By.ID, 'btnAceptar')
+    
+    return {
+        "status": "success",
+        "chrome_working": True,
+        "sunat_title": sunat_title,
+        "sunat_input_found": input_ruc is not None,
+        "sunat_button_found": btn_buscar is not None,
+        "message": "Chrome está funcionando correctamente"
+    }
+
 @app.get("/test-chrome")
-async def test_chrome():
-    """Endpoint de diagnóstico para verificar que Chrome funciona correctamente."""
+async def test_chrome(full: bool = False):
+    """Endpoint de diagnóstico para verificar que Chrome funciona correctamente.
+
+    Sin ?full=1 solo hace la prueba de red (sin levantar Chrome); con ?full=1
+    verifica que el formulario de SUNAT cargue usando un driver del pool, o
+    iniciando Chrome si el pool no está disponible.
+    """
+    if not full:
+        return {
+            **(await test_network()),
+            "message": "Prueba de red sin Chrome; usa ?full=1 para probar Chrome contra SUNAT"
+        }
+
     try:
         logger.info("Iniciando test de Chrome...")
-        driver, wait = config_driver()
-        
-        try:
-            # Intentar navegar a una página simple
-            logger.info("Navegando a Google...")
-            driver.get("https://www.google.com")
-            title = driver.title
-            logger.info(f"Título de la página: {title}")
-            
-            # Intentar navegar a SUNAT
-            logger.info("Navegando a SUNAT...")
-            driver.get('https://e-consultaruc.sunat.gob.pe/cl-ti-itmrconsruc/FrameCriterioBusquedaWeb.jsp')
-            sunat_title = driver.title
-            logger.info(f"Título de SUNAT: {sunat_title}")
-            
-            # Verificar que existan los elementos necesarios
-            input_ruc = driver.find_element(By.XPATH, "//input[@placeholder='Ingrese RUC']")
-            btn_buscar = driver.find_element(By.ID, 'btnAceptar')
-            
-            return {
-                "status": "success",
-                "chrome_working": True,
-                "google_title": title,
-                "sunat_title": sunat_title,
-                "sunat_input_found": input_ruc is not None,
-                "sunat_button_found": btn_buscar is not None,
-                "message": "Chrome está funcionando correctamente"
-            }
-        finally:
-            driver.quit()
-            
+        pool: Optional[DriverPool] = app.state.pool
+        if pool is None:
+            driver, wait = await _en_executor(config_driver)
+            try:
+                return await _en_executor(_probar_chrome_sunat, driver)
+            finally:
+                await _en_executor(driver.quit)
+
+        # Mismo semáforo que las consultas: el diagnóstico no puede quitarles un driver
+        async with app.state.semaforo:
+            driver, wait = await pool.acquire()
+            try:
+                return await _en_executor(_probar_chrome_sunat, driver)
+            finally:
+                await pool.release(driver, wait)
     except WebDriverException as e:
         error_msg = f"Error de WebDriver: {str(e)}"
-        logger.error(error_msg)
-        logger.error(traceback.format_exc())
+        logger.exception("Error en test de Chrome")
         return {
             "status": "error",
             "chrome_working": False,
@@ -294,8 +805,7 @@ async def test_chrome():
         }
     except Exception as e:
         error_msg = f"Error general: {str(e)}"
-        logger.error(error_msg)
-        logger.error(traceback.format_exc())
+        logger.exception("Error en test de Chrome")
         return {
             "status": "error",
             "chrome_working": False,
@@ -305,40 +815,104 @@ async def test_chrome():
         }
 
 @app.post("/consulta-ruc")
-async def consultar_ruc_endpoint(request: ConsultaRUCRequest):
+async def consultar_ruc_endpoint(request: ConsultaRUCRequest, response: Response):
     """
     Consulta un único RUC en SUNAT.
     
     Args:
         request: Objeto con el RUC a consultar
+        response: Respuesta de FastAPI, usada para agregar los headers de caché
         
     Returns:
         Diccionario con los datos del RUC consultado
     """
     try:
-        logger.info(f"Iniciando consulta para RUC: {request.ruc}")
-        resultado = consultar_ruc_sunat(ruc=request.ruc)
+        logger.info("Iniciando consulta para RUC: %s", request.ruc)
+        resultado = await consultar_ruc_sunat(ruc=request.ruc)
         
         if resultado is None:
-            logger.warning(f"No se pudo obtener información para RUC {request.ruc}")
+            logger.warning("No se pudo obtener información para RUC %s", request.ruc)
             raise HTTPException(
                 status_code=404,
                 detail=f"No se pudo obtener información para el RUC {request.ruc}. Verifica que el RUC sea válido y que el servicio de SUNAT esté disponible."
             )
         
-        logger.info(f"Consulta exitosa para RUC: {request.ruc}")
-        return JSONResponse(content=resultado)
+        logger.info("Consulta exitosa para RUC: %s", request.ruc)
+        response.headers.update(CACHE_HEADERS)
+        return resultado
     except HTTPException:
         raise
     except Exception as e:
         error_detail = f"Error al consultar RUC {request.ruc}: {str(e)}"
-        logger.error(error_detail)
-        logger.error(traceback.format_exc())
+        logger.exception("Error al consultar RUC %s", request.ruc)
         raise HTTPException(
             status_code=500,
             detail=error_detail
         )
+
+async def _consultar_en_lote(ruc: str) -> Optional[Dict]:
+    """Consulta un RUC dentro de un lote.
+
+    Un error en un RUC no debe tumbar el lote: se registra y se devuelve None.
+    """
+    try:
+        return await consultar_ruc_sunat(ruc)
+    except Exception:
+        logger.exception("Error en consulta múltiple para RUC %s", ruc)
+        return None
+
+@app.post("/consulta-multiple")
+async def consulta_multiple(request: ConsultaMultipleRUCRequest):
+    """
+    Consulta varios RUCs en SUNAT en paralelo.
     
+    Args:
+        request: Objeto con la lista de RUCs y si se debe devolver un Excel
+        
+    Returns:
+        Lista con los datos de cada RUC, o un archivo Excel si guardar_excel es True
+    """
+    if not request.rucs:
+        raise HTTPException(status_code=400, detail="Debe enviar al menos un RUC")
+
+    logger.info("Iniciando consulta múltiple de %d RUCs", len(request.rucs))
+    resultados = await asyncio.gather(*[_consultar_en_lote(ruc) for ruc in request.rucs])
+
+    filas = []
+    for ruc, resultado in zip(request.rucs, resultados):
+        if resultado is None:
+            filas.append({'Número de RUC': ruc, 'Error': 'No se pudo obtener información'})
+        else:
+            filas.append(resultado)
+    exitosos = sum(1 for resultado in resultados if resultado is not None)
+    logger.info("Consulta múltiple finalizada: %d/%d exitosos", exitosos, len(request.rucs))
+
+    if request.guardar_excel:
+        archivo = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
+        archivo.close()
+        await asyncio.to_thread(lambda: pd.DataFrame(filas).to_excel(archivo.name, index=False))
+        return FileResponse(
+            archivo.name,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            filename="consulta_rucs.xlsx",
+            background=BackgroundTask(os.remove, archivo.name)
+        )
+
+    return {
+        "total": len(request.rucs),
+        "exitosos": exitosos,
+        "resultados": filas
+    }
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="127.0.0.1",port='5000')
\ No newline at end of file
+    # Cada worker levanta su propio pool de Chrome en el evento startup
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", "5000")),
+        workers=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        loop="uvloop",
+        http="httptools",
+        log_level="info"
+    )
\ No newline at end of file